@@ -1,4 +1,5 @@
-from typing import Any, Iterable, Generator
+import json
+from typing import Any, Callable, Iterable, Generator, Optional, TextIO
 from typing import Dict
 
 # Notes: I used black to format the code to keep lines under 100 characters
@@ -11,30 +12,20 @@ by each Weather Station
 Control will be used to either output the result or reset the Weather Metrics
 """
 
-class Sample:
+class WeatherState:
     """
-    This Class deals with processing the Sample Weather Data
+    This Class holds the Weather Metrics, the high and low temperatures by Weather Station,
+    and the latest timestamp of any sample
+    Highs and lows are kept in two parallel dicts keyed by station name so a sample only
+    touches floats rather than a nested dict per station
     """
-    @staticmethod
-    def process_weather_sample(
-        metrics: Dict[str, Dict[str, float]], station_name: str, temperature: float
-    ) -> None:
-        """
-        If station name is not in dict, create new entry and set high and low to the temperature
-        If station name is in dict take the max of the existing temp or new temp for the max value
-        If station name is in dict take the min of the existing temp or new temp for the min value
-        Updateds the dict of station name, high, low
-       
-        Args:
-            metrics: dictionary of metrics of station name, high, low
-            stationName: key in dict
-            temperature: value to compare
-        """
-        if station_name not in metrics:
-            metrics[station_name] = {"high": temperature, "low": temperature}
-        else:
-            metrics[station_name]["high"] = max(metrics[station_name]["high"], temperature)
-            metrics[station_name]["low"] = min(metrics[station_name]["low"], temperature)
+
+    __slots__ = ("highs", "lows", "latest_timestamp")
+
+    def __init__(self) -> None:
+        self.highs: Dict[str, float] = {}
+        self.lows: Dict[str, float] = {}
+        self.latest_timestamp = 0
 
 
 class Control:
@@ -43,19 +34,52 @@ class Control:
     These can be either Snapshot or Reset
     """
     @staticmethod
-    def process_snapshot(metrics: Dict[str, Dict[str, float]], timestamp: int) -> Dict[str, Any]:
+    def process_snapshot(
+        highs: Dict[str, float], lows: Dict[str, float], timestamp: int
+    ) -> Dict[str, Any]:
         """
         Output as a json, metrics for all stations as of the latest timestamp of any sample
+        The nested station name, high, low form is only built here, once per snapshot
         Args:
-            metrics: dictionary of metrics of station name, high, low
+            highs: dictionary of station name to high temperature
+            lows: dictionary of station name to low temperature
             timestamp: latest timestamp of any sample
         
         Returns a dictionary of the snapshot output
         """
-
-        output = {"type": "snapshot", "asOf": timestamp, "stations": metrics}
+        stations = {name: {"high": high, "low": lows[name]} for name, high in highs.items()}
+        output = {"type": "snapshot", "asOf": timestamp, "stations": stations}
         return output
 
+    @staticmethod
+    def stream_snapshot(
+        highs: Dict[str, float], lows: Dict[str, float], timestamp: int, out: TextIO
+    ) -> None:
+        """
+        Writes the same json as json.dumps(process_snapshot(...)) to out one station at a time
+        For large numbers of stations this avoids building the nested stations dict and the
+        whole encoded string in memory at once
+        This is a standalone API for callers that hold the highs and lows themselves, it is not
+        used by process_events or __main__. Its output matches the line __main__ prints for a
+        snapshot, apart from the trailing newline
+
+        Args:
+            highs: dictionary of station name to high temperature
+            lows: dictionary of station name to low temperature
+            timestamp: latest timestamp of any sample
+            out: text stream the snapshot json is written to
+        """
+        write = out.write
+        dumps = json.dumps
+        write(f'{{"type": "snapshot", "asOf": {dumps(timestamp)}, "stations": {{')
+        separator = ""
+        for name, high in highs.items():
+            write(
+                f'{separator}{dumps(name)}: {{"high": {dumps(high)}, "low": {dumps(lows[name])}}}'
+            )
+            separator = ", "
+        write("}}")
+
 
     @staticmethod
     def process_reset(timestamp: int) -> Dict[str, int]:
@@ -70,54 +94,100 @@ class Control:
         return output
 
 
+def _control_snapshot(state: WeatherState) -> Optional[Dict[str, Any]]:
+    """
+    Snapshot control handler. Snapshots received when no sample data is present are ignored
+    """
+    if state.highs:
+        return Control.process_snapshot(state.highs, state.lows, state.latest_timestamp)
+    return None
+
+
+def _control_reset(state: WeatherState) -> Optional[Dict[str, Any]]:
+    """
+    Reset control handler. Clears out the highs and lows dicts
+    latest timestamp is not being reset as it is guaranteed not to decrease
+    """
+    state.highs.clear()
+    state.lows.clear()
+    return Control.process_reset(state.latest_timestamp)
+
+
+# Control commands resolve to their handler with one dict lookup rather than a chain of compares
+_CONTROL_HANDLERS: Dict[str, Callable[[WeatherState], Optional[Dict[str, Any]]]] = {
+    "snapshot": _control_snapshot,
+    "reset": _control_reset,
+}
+
+
+def _parse_temperature(temperature: Any) -> float:
+    """
+    Converts a temperature that json did not decode as a float, such as an int or string
+
+    Args:
+        temperature: temperature value from the sample json
+    Returns the temperature as a float
+    """
+    try:
+        return float(temperature)
+    except (TypeError, ValueError) as ex:
+        raise ValueError("Temperature value is not valid") from ex
+
+
 def process_events(events: Iterable[dict[str, Any]]) -> Generator[dict[str, Any], None, None]:
     """
-    Processes the inputed json events. Using match to determine if the event type is a Sample
-    or Control
+    Processes the inputed json events. Samples update the highs and lows directly and
+    Control commands are dispatched to their handler
 
     Args:
         events: A stream of events passed as dicts which is the json input.
     Returns:
         Dictionry with desired output whether its a snapshot or reset message
     """
-    weather_metrics = {}
-    latest_timestamp = 0
+    state = WeatherState()
+    # Bound once so the sample branch loads them as locals instead of looking up attributes
+    # highs and lows are only ever cleared in place so these stay valid across resets
+    highs = state.highs
+    lows = state.lows
+    get_high = highs.get
     for event in events:
         event_type = event.get("type")
-        match event_type:
-            case "sample":
-                # Because timestamp is guaranteed never to decrease,
-                # we can assume that the timestamp in the event is the latest
-                # Ensure that the sample json contains all relevant fields
-                # Ensure temperature is a float
-                sample_keys = ["stationName", "timestamp", "temperature"]
-                if set(sample_keys).issubset(event.keys()):
-                    latest_timestamp = event.get("timestamp")
-                    station_name = event.get("stationName")
-                    try:
-                        temperature = float(event.get("temperature"))
-                    except ValueError as ex:
-                        raise ValueError("Temperature value is not valid") from ex
-
-                    Sample.process_weather_sample(weather_metrics, station_name, temperature)
-                else:
-                    raise ValueError("Not all keys are present in json")
-            case "control":
-                command = event.get("command")
-                match command:
-                    case "snapshot":
-                        if weather_metrics:
-                            yield Control.process_snapshot(weather_metrics, latest_timestamp)
-                    case "reset":
-                        # Clearing out the metrics dict
-                        # latest timestamp is not being reset as it is guaranteed not to decrease
-                        weather_metrics.clear()
-                        yield Control.process_reset(latest_timestamp)
-                    case _:
-                        raise ValueError(
-                            "Unknown control. Please provide either a snapshot or reset control"
-                        )
-            case _:
+        # Samples make up almost all of the stream so they are checked first
+        if event_type == "sample":
+            # Because timestamp is guaranteed never to decrease,
+            # we can assume that the timestamp in the event is the latest
+            # Ensure that the sample json contains all relevant fields
+            try:
+                station_name = event["stationName"]
+                state.latest_timestamp = event["timestamp"]
+                temperature = event["temperature"]
+            except KeyError as ex:
+                raise ValueError("Not all keys are present in json") from ex
+            # Ensure temperature is a float, json already decodes most temperatures as floats
+            if type(temperature) is not float:  # pylint: disable=unidiomatic-typecheck
+                temperature = _parse_temperature(temperature)
+
+            # A new station sets both high and low, otherwise the temperature can only raise the
+            # high or lower the low, never both
+            high = get_high(station_name)
+            if high is None:
+                highs[station_name] = lows[station_name] = temperature
+            elif temperature > high:
+                highs[station_name] = temperature
+            elif temperature < lows[station_name]:
+                lows[station_name] = temperature
+        elif event_type == "control":
+            command = event.get("command")
+            # Only strings are looked up so unhashable commands still get the informative error
+            handler = _CONTROL_HANDLERS.get(command) if isinstance(command, str) else None
+            if handler is None:
                 raise ValueError(
-                    "Unknown input type. Please provide either a sample or control message"
+                    "Unknown control. Please provide either a snapshot or reset control"
                 )
+            output = handler(state)
+            if output is not None:
+                yield output
+        else:
+            raise ValueError(
+                "Unknown input type. Please provide either a sample or control message"
+            )
@@ -2,7 +2,8 @@ from unittest import TestCase
 from unittest.mock import patch
 from io import StringIO
 import json
-from interview.weather import Sample, Control
+import runpy
+from interview.weather import Control
 from . import weather
 
 # Notes: I used black to format the code to keep lines under 100 characters
@@ -99,23 +100,55 @@ class TestWeather(TestCase):
         output = mock_stdout.getvalue().strip()
         self.assertEqual(output, expected_output)
 
-    def test_process_weather_sample_new_station(self):
-        """ 
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_main_round_trip(self, mock_stdout):
+        """
+        Tests running the module end to end, reading json lines from stdin
+        and writing one json line per output to stdout
+        NaN is accepted as a temperature because the stdlib json decoder allows it
+        """
+        stdin = StringIO(
+            '{"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 20.0}\n'
+            '{"type": "sample", "stationName": "Station1", "timestamp": 2, "temperature": 30}\n'
+            '{"type": "sample", "stationName": "Station2", "timestamp": 3, "temperature": NaN}\n'
+            '{"type": "control", "command": "snapshot"}\n'
+            '{"type": "control", "command": "reset"}\n'
+        )
+        with patch("sys.stdin", stdin):
+            runpy.run_module("interview", run_name="__main__")
+        expected_output = [
+            '{"type": "snapshot", "asOf": 3, "stations": {"Station1": {"high": 30.0, "low": 20.0}, '
+            '"Station2": {"high": NaN, "low": NaN}}}',
+            '{"type": "reset", "asOf": 3}',
+        ]
+        self.assertEqual(mock_stdout.getvalue().splitlines(), expected_output)
+
+    def test_process_events_new_station(self):
+        """
         Tests what happens when the first sample for a station is passed in
         """
-        metrics = {}
-        Sample.process_weather_sample(metrics, "Station1", 25.1)
-        self.assertEqual(metrics, {"Station1": {"high": 25.1, "low": 25.1}})
+        events = [
+            {"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 25.1},
+            {"type": "control", "command": "snapshot"},
+        ]
+        (snapshot,) = weather.process_events(events)
+        self.assertEqual(snapshot["stations"], {"Station1": {"high": 25.1, "low": 25.1}})
 
-    def test_process_weather_sample_update_high_and_low(self):
+    def test_process_events_update_high_and_low(self):
         """
         Tests if the high and low values of a station are updated when new
         events are passed
         """
-        metrics = {"Station1": {"high": 20.0, "low": 10.0}}
-        Sample.process_weather_sample(metrics, "Station1", 25.0)
-        Sample.process_weather_sample(metrics, "Station1", 5.0)
-        self.assertEqual(metrics, {"Station1": {"high": 25.0, "low": 5.0}})
+        events = [
+            {"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 20.0},
+            {"type": "sample", "stationName": "Station1", "timestamp": 2, "temperature": 10.0},
+            {"type": "sample", "stationName": "Station1", "timestamp": 3, "temperature": 25.0},
+            {"type": "sample", "stationName": "Station1", "timestamp": 4, "temperature": 5.0},
+            {"type": "sample", "stationName": "Station1", "timestamp": 5, "temperature": 15.0},
+            {"type": "control", "command": "snapshot"},
+        ]
+        (snapshot,) = weather.process_events(events)
+        self.assertEqual(snapshot["stations"], {"Station1": {"high": 25.0, "low": 5.0}})
 
     @patch("sys.stdout", new_callable=StringIO)
     def test_process_snapshot(self, mock_stdout):
@@ -123,13 +156,34 @@ class TestWeather(TestCase):
         Tests the snapshot control messsage to see if it generates the right output
         """
         metrics = {"Station1": {"high": 25.0, "low": 15.0}}
-        result = Control.process_snapshot(metrics, 1672531200000)
+        result = Control.process_snapshot({"Station1": 25.0}, {"Station1": 15.0}, 1672531200000)
         print(json.dumps(result))
         expected_output = json.dumps(
             {"type": "snapshot", "asOf": 1672531200000, "stations": metrics}
         )
         self.assertEqual(mock_stdout.getvalue().strip(), expected_output)
 
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_stream_snapshot(self, mock_stdout):
+        """
+        Tests that the streamed snapshot writes the same json that running the module
+        prints for the snapshot output
+        """
+        stdin = StringIO(
+            '{"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 25.0}\n'
+            '{"type": "sample", "stationName": "Station1", "timestamp": 2, "temperature": 15.0}\n'
+            '{"type": "sample", "stationName": "Station \\"2\\"", "timestamp": 3, '
+            '"temperature": -3}\n'
+            '{"type": "control", "command": "snapshot"}\n'
+        )
+        with patch("sys.stdin", stdin):
+            runpy.run_module("interview", run_name="__main__")
+        highs = {"Station1": 25.0, 'Station "2"': -3.0}
+        lows = {"Station1": 15.0, 'Station "2"': -3.0}
+        out = StringIO()
+        Control.stream_snapshot(highs, lows, 3, out)
+        self.assertEqual(out.getvalue() + "\n", mock_stdout.getvalue())
+
     @patch("sys.stdout", new_callable=StringIO)
     def test_process_reset(self, mock_stdout):
         """
@@ -158,6 +212,24 @@ class TestWeather(TestCase):
                 )
             )
 
+    def test_process_events_invalid_temperature(self):
+        """
+        Test for a sample whose temperature cannot be read as a float
+        """
+        with self.assertRaises(ValueError):
+            list(
+                weather.process_events(
+                    [
+                        {
+                            "type": "sample",
+                            "stationName": "Station1",
+                            "timestamp": 1672531200000,
+                            "temperature": "warm",
+                        }
+                    ]
+                )
+            )
+
     def test_process_events_invalid_control(self):
         """
         Tests for a bad control message
@@ -196,3 +268,66 @@ class TestWeather(TestCase):
                     ]
                 )
             )
+
+    def test_process_events_near_miss_type_and_command(self):
+        """
+        Tests that types and commands sharing a prefix with a known one are still rejected
+        Dispatch has to compare the whole string, not just its first character
+        """
+        near_misses = [
+            {"type": "sampler", "stationName": "Station1", "timestamp": 1, "temperature": 20.0},
+            {"type": "control", "command": "snap"},
+            {"type": "control", "command": "restart"},
+            {"type": "control", "command": ["snapshot"]},
+            {"type": "control", "command": {}},
+        ]
+        for event in near_misses:
+            with self.subTest(event=event), self.assertRaises(ValueError):
+                list(weather.process_events([event]))
+
+    def test_process_events_is_lazy(self):
+        """
+        Tests that outputs are yielded as soon as their control message is read
+        process_events must not consume the rest of the stream before yielding
+        """
+
+        def generate_events():
+            yield {"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 20.0}
+            yield {"type": "control", "command": "snapshot"}
+            raise AssertionError("Read past the snapshot before yielding it")
+
+        outputs = weather.process_events(generate_events())
+        self.assertEqual(next(outputs)["type"], "snapshot")
+
+    def test_process_events_snapshot_is_not_live(self):
+        """
+        Tests that a snapshot keeps the values it was taken with
+        Later samples and resets must not change a snapshot that was already yielded
+        """
+        events = [
+            {"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 20.0},
+            {"type": "control", "command": "snapshot"},
+            {"type": "sample", "stationName": "Station1", "timestamp": 2, "temperature": 30.0},
+            {"type": "control", "command": "reset"},
+        ]
+        snapshot, _ = list(weather.process_events(events))
+        self.assertEqual(snapshot["stations"], {"Station1": {"high": 20.0, "low": 20.0}})
+
+    def test_process_events_outputs_are_independent(self):
+        """
+        Tests that each output is its own dict
+        Collecting the outputs must keep the asOf of every snapshot and reset
+        """
+        events = [
+            {"type": "sample", "stationName": "Station1", "timestamp": 1, "temperature": 20.0},
+            {"type": "control", "command": "snapshot"},
+            {"type": "control", "command": "reset"},
+            {"type": "sample", "stationName": "Station1", "timestamp": 2, "temperature": 30.0},
+            {"type": "control", "command": "snapshot"},
+            {"type": "control", "command": "reset"},
+        ]
+        outputs = list(weather.process_events(events))
+        self.assertEqual(
+            [(output["type"], output["asOf"]) for output in outputs],
+            [("snapshot", 1), ("reset", 1), ("snapshot", 2), ("reset", 2)],
+        )